@@ -2,17 +2,1403 @@ import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
 import json
 import requests
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import threading
 import os
 import sys
 import re
+import hashlib
+import sqlite3
+import math
+import time
+import queue
+import heapq
+import functools
+import mmap
+import struct
+from array import array
+from collections import deque, Counter
+from itertools import accumulate, chain
+
+try:
+    import jieba  # 可选：安装后使用jieba分词，否则使用字符二元组
+except ImportError:
+    jieba = None
 
 # 设置高DPI支持
 if sys.platform.startswith('win'):
     import ctypes
     ctypes.windll.shcore.SetProcessDpiAwareness(1)
 
+# 端点配置文件（与脚本同目录），不存在时使用默认的DeepSeek端点
+ENDPOINTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endpoints.json")
+DEFAULT_ENDPOINTS = [
+    {
+        "name": "DeepSeek",
+        "url": "https://api.deepseek.com/v1/chat/completions",
+        "model": "deepseek-chat",
+        "include_usage": True
+    }
+]
+EWMA_ALPHA = 0.3            # 延迟滑动平均的平滑系数
+DEFAULT_HEDGE_DELAY = 3.0   # 样本不足时的对冲等待时间（秒）
+ENDPOINT_COOLDOWN = 30      # 端点出错后的基础冷却时间（秒）
+
+# 本地数据目录
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".groupchat_report")
+JOURNAL_DIR = os.path.join(DATA_DIR, "journals")
+JOURNAL_MAX_AGE = 7 * 24 * 3600   # 未完成的输出日志保留时间（秒）
+MAX_RESUME_ATTEMPTS = 3           # 流中断后自动续写的最大次数
+MAX_CONTINUATIONS = 3             # finish_reason为length时自动续写的最大次数
+DEFAULT_MAX_TOKENS = 2000         # 无法解析聊天记录时使用的输出上限
+MIN_OUTPUT_TOKENS = 512
+MAX_OUTPUT_TOKENS = 4096
+TOPIC_GAP = 30 * 60               # 相邻消息间隔超过该值（秒）视为新话题
+HISTORY_DB = os.path.join(DATA_DIR, "history.db")
+ROLLUP_PERIODS = {"week": (7, "周报"), "month": (30, "月报")}
+ROLLUP_MAX_TOKENS = 3000
+INDEX_SUFFIX = ".bm25"             # 检索索引保存在聊天记录文件旁
+INDEX_VERSION = 3
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+PARSER_VERSION = 1                # 解析逻辑变化时递增，使旧快照失效
+SNAPSHOT_MAX_AGE = 30 * 24 * 3600 # 超过该时间未使用的快照被清理（秒）
+SNAPSHOT_MAX_BYTES = 1 << 30      # 快照目录总大小上限
+WINDOW_SIZE = 8                   # 每个检索片段包含的消息数
+WINDOW_STRIDE = 4                 # 相邻片段的起始间隔（相互重叠）
+BM25_K1 = 1.5
+BM25_B = 0.75
+FOLLOWUP_TOP_K = 5
+FOLLOWUP_MAX_TOKENS = 1000
+FOLLOWUP_PLACEHOLDER = "对日报有疑问？例如：张三关于发布说了什么"
+HISTORY_SEARCH_LIMIT = 50
+CONTINUE_INSTRUCTION = "输出在中途被截断了，请从上次中断处直接继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。"
+
+
+# 聊天记录消息头，如 "2024-01-20 09:00:00 张三" 或 "张三 2024-01-20 09:00:00"
+TIME_PATTERN = r'\d{4}[-/]\d{1,2}[-/]\d{1,2}[ T]\d{1,2}:\d{2}(?::\d{2})?'
+MESSAGE_HEADER_PATTERNS = [
+    re.compile(rf'^(?P<time>{TIME_PATTERN})\s+(?P<speaker>[^:：]+?)(?:\s*[:：]\s*(?P<content>.*))?$'),
+    re.compile(rf'^(?P<speaker>[^:：]+?)\s+(?P<time>{TIME_PATTERN})\s*$'),
+]
+JSON_TIME_KEYS = ("time", "timestamp", "CreateTime", "create_time", "date")
+JSON_SPEAKER_KEYS = ("sender", "talker", "nickname", "name", "from", "user")
+JSON_CONTENT_KEYS = ("content", "message", "text", "msg", "StrContent")
+
+
+def parse_timestamp(value):
+    """将时间字符串或时间戳转为秒级时间戳，无法解析时返回None"""
+    if isinstance(value, (int, float)):
+        return int(value / 1000 if value > 1e11 else value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip().replace("/", "-").replace("T", " ")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return int(datetime.strptime(text, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def parse_chat_messages(chat_history):
+    """解析聊天记录为消息列表，每条消息为 {"ts", "speaker", "content"}"""
+    stripped = chat_history.lstrip()
+    if stripped.startswith(("[", "{")):
+        try:
+            data = json.loads(stripped)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            data = data.get("messages")
+        if isinstance(data, list):
+            return parse_json_messages(data)
+        
+    messages = []
+    for line in chat_history.splitlines():
+        for pattern in MESSAGE_HEADER_PATTERNS:
+            match = pattern.match(line.strip())
+            if match:
+                messages.append({
+                    "ts": parse_timestamp(match.group("time")),
+                    "speaker": match.group("speaker").strip(),
+                    "content": (match.groupdict().get("content") or "").strip()
+                })
+                break
+        else:
+            if messages and line.strip():
+                current = messages[-1]
+                current["content"] = (current["content"] + "\n" + line.strip()).strip()
+    return messages
+
+
+def parse_json_messages(items):
+    """解析JSON格式导出的消息列表"""
+    def first_value(item, keys):
+        for key in keys:
+            if item.get(key) not in (None, ""):
+                return item[key]
+        return None
+    
+    messages = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        content = first_value(item, JSON_CONTENT_KEYS)
+        messages.append({
+            "ts": parse_timestamp(first_value(item, JSON_TIME_KEYS)),
+            "speaker": str(first_value(item, JSON_SPEAKER_KEYS) or ""),
+            "content": content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        })
+    return messages
+
+
+def count_active_topics(messages):
+    """按时间间隔切分对话段，统计至少3条消息的活跃话题数"""
+    topics = 0
+    segment_size = 0
+    last_ts = None
+    for message in messages:
+        ts = message["ts"]
+        if last_ts is not None and ts is not None and ts - last_ts > TOPIC_GAP:
+            topics += segment_size >= 3
+            segment_size = 0
+        segment_size += 1
+        if ts is not None:
+            last_ts = ts
+    topics += segment_size >= 3
+    return max(topics, 1)
+
+
+def estimate_max_tokens(message_count, topic_count):
+    """根据消息数和活跃话题数估算输出所需的max_tokens"""
+    if not message_count:
+        return DEFAULT_MAX_TOKENS
+    tokens = 400 + 5 * message_count + 250 * topic_count
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, tokens))
+
+
+class ChatSnapshot:
+    """解析后聊天记录的二进制快照，以内存映射方式按需读取消息
+    
+    文件结构：魔数、头部长度、JSON头部（来源文件信息、发言人表、统计信息），
+    随后是定长消息记录 (时间戳, 发言人编号, 内容偏移, 内容长度)，最后是UTF-8内容区。
+    快照按路径、大小、修改时间和解析器版本区分，任一变化即重新解析。
+    """
+
+    MAGIC = b"GCRS"
+    PREFIX = struct.Struct("<4sI")
+    RECORD = struct.Struct("<qIQI")
+
+    def __init__(self, buffer, file=None):
+        self.buffer = buffer
+        self.file = file
+        magic, header_len = self.PREFIX.unpack_from(buffer, 0)
+        if magic != self.MAGIC:
+            raise ValueError("不是有效的快照文件")
+        self.header = json.loads(bytes(buffer[self.PREFIX.size:self.PREFIX.size + header_len]).decode('utf-8'))
+        self.records_offset = self.PREFIX.size + header_len
+        self.content_offset = self.records_offset + self.header["count"] * self.RECORD.size
+        self.speakers = [name for name, _ in self.header["stats"]["speakers"]]
+        self.refs = 0  # 正在使用该快照的任务数，由调用方在加锁后维护
+        self.index = None  # 该快照的检索索引，随快照一起关闭
+
+    @property
+    def stats(self):
+        return self.header["stats"]
+
+    @staticmethod
+    def source_key(export_path):
+        stat = os.stat(export_path)
+        return {
+            "path": os.path.abspath(export_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "parser_version": PARSER_VERSION
+        }
+
+    @staticmethod
+    def snapshot_path(key):
+        path_hash = hashlib.sha1(key["path"].encode('utf-8')).hexdigest()[:12]
+        key_hash = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(SNAPSHOT_DIR, f"{path_hash}-{key_hash}.snap")
+
+    @classmethod
+    def load_or_build(cls, export_path, chat_history=None):
+        """加载有效快照；没有时解析聊天记录并写入新快照"""
+        key = cls.source_key(export_path)
+        path = cls.snapshot_path(key)
+        if os.path.exists(path):
+            try:
+                snapshot = cls.open(path)
+                if snapshot.header["source"] == key:
+                    os.utime(path)  # 记录最近使用时间，供清理时参考
+                    return snapshot
+                snapshot.close()
+            except (OSError, ValueError, KeyError, struct.error):
+                pass
+        
+        if chat_history is None:
+            with open(export_path, 'r', encoding='utf-8') as f:
+                chat_history = f.read()
+        data = cls.serialize(key, parse_chat_messages(chat_history))
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            cls.evict(keep=path)
+        except OSError:
+            pass  # 缓存目录不可写时直接使用内存中的快照
+        return cls(data)
+
+    @classmethod
+    def open(cls, path):
+        f = open(path, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            f.close()
+            raise
+        return cls(buffer, f)
+
+    @classmethod
+    def serialize(cls, key, messages):
+        """将消息列表编码为快照字节串"""
+        speaker_ids = {}
+        speaker_counts = []
+        records = bytearray()
+        contents = bytearray()
+        timestamps = []
+        for message in messages:
+            speaker_id = speaker_ids.get(message["speaker"])
+            if speaker_id is None:
+                speaker_id = speaker_ids[message["speaker"]] = len(speaker_counts)
+                speaker_counts.append([message["speaker"], 0])
+            speaker_counts[speaker_id][1] += 1
+            content = message["content"].encode('utf-8')
+            ts = -1 if message["ts"] is None else message["ts"]
+            records += cls.RECORD.pack(ts, speaker_id, len(contents), len(content))
+            contents += content
+            if message["ts"] is not None:
+                timestamps.append(message["ts"])
+        header = {
+            "source": key,
+            "count": len(messages),
+            "stats": {
+                "count": len(messages),
+                "topics": count_active_topics(messages),
+                "first_ts": min(timestamps) if timestamps else None,
+                "last_ts": max(timestamps) if timestamps else None,
+                "speakers": speaker_counts
+            }
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        return b"".join([cls.PREFIX.pack(cls.MAGIC, len(header_bytes)), header_bytes, records, contents])
+
+    @staticmethod
+    def evict(keep=None):
+        """清理过期快照：同一文件的旧版本、长期未使用的快照，以及超出总大小上限的部分"""
+        entries = []
+        for name in os.listdir(SNAPSHOT_DIR):
+            path = os.path.join(SNAPSHOT_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        keep_prefix = os.path.basename(keep).split("-")[0] if keep else None
+        now = time.time()
+        total = 0
+        for mtime, size, path in sorted(entries, reverse=True):
+            stale = (
+                path != keep and (
+                    os.path.basename(path).split("-")[0] == keep_prefix
+                    or now - mtime > SNAPSHOT_MAX_AGE
+                    or total + size > SNAPSHOT_MAX_BYTES
+                )
+            )
+            if stale:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Windows下仍被映射的快照无法删除，留待下次清理
+            else:
+                total += size
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+        if self.file is not None:
+            self.buffer.close()
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return self.header["count"]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        ts, speaker_id, offset, length = self.RECORD.unpack_from(
+            self.buffer, self.records_offset + index * self.RECORD.size)
+        start = self.content_offset + offset
+        return {
+            "ts": None if ts < 0 else ts,
+            "speaker": self.speakers[speaker_id],
+            "content": bytes(self.buffer[start:start + length]).decode('utf-8')
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+REPORT_SECTION_KEYWORDS = {
+    "main": ("主要内容",),
+    "mentions": ("与我有关",),
+}
+DECISION_KEYWORDS = ("决定", "决策", "确定", "通过", "定了", "敲定")
+TODO_KEYWORDS = ("待办", "TODO", "todo", "负责", "截止", "跟进", "需要", "完成")
+
+
+def extract_report_sections(report):
+    """从markdown日报中提取群聊名称、话题、决策、待办和与我有关的内容"""
+    sections = {"group": "", "topics": [], "decisions": [], "todos": [], "mentions": []}
+    current = None
+    for line in report.splitlines():
+        text = line.strip()
+        if not text:
+            continue
+        plain = text.lstrip("#-*> ").replace("**", "").strip()
+        
+        match = re.match(r'群聊名称\s*[:：]\s*(.+)', plain)
+        if match:
+            sections["group"] = match.group(1).strip()
+            continue
+        
+        # 章节标记，如 "**主要内容**：" 或 "## 与我有关"
+        label, _, rest = plain.partition("：") if "：" in plain else plain.partition(":")
+        for name, keywords in REPORT_SECTION_KEYWORDS.items():
+            if any(keyword in label for keyword in keywords) and len(label) <= 10:
+                current = name
+                plain = rest.strip()
+                break
+        else:
+            if text.startswith("#"):
+                if current == "main":
+                    sections["topics"].append(plain)
+                continue
+            
+        if not plain or current is None:
+            continue
+        if current == "mentions":
+            sections["mentions"].append(plain)
+        elif any(keyword in plain for keyword in DECISION_KEYWORDS):
+            sections["decisions"].append(plain)
+        elif any(keyword in plain for keyword in TODO_KEYWORDS):
+            sections["todos"].append(plain)
+        else:
+            sections["topics"].append(plain)
+    return sections
+
+
+class ReportStore:
+    """本地日报库（SQLite）
+
+    保存每日日报的结构化内容（供周报/月报汇总）、每次生成的报告及元数据、
+    解析后的聊天消息，并为报告和消息建立FTS5全文索引。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS daily_reports (
+            id INTEGER PRIMARY KEY,
+            group_name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            report TEXT NOT NULL,
+            topics TEXT NOT NULL,
+            decisions TEXT NOT NULL,
+            todos TEXT NOT NULL,
+            mentions TEXT NOT NULL,
+            truncated INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            UNIQUE (group_name, report_date)
+        );
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            date_start TEXT,
+            date_end TEXT,
+            model TEXT,
+            endpoint TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            ttft REAL,
+            duration REAL,
+            round_trips INTEGER,
+            report TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            group_name TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            speaker TEXT NOT NULL,
+            content TEXT NOT NULL,
+            digest BLOB NOT NULL UNIQUE
+        );
+    """
+
+    # 全文索引：报告和消息先切分为字符二元组（bigram_tokens），再存入unicode61分词的
+    # 无内容FTS5表，两个字的中文词（人名、常用词）也能命中索引。词元在写入时由
+    # save_run/save_messages计算，不依赖触发器，其他工具也能正常写入主表
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS runs_terms USING fts5(
+            terms, content='', tokenize='unicode61'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_terms USING fts5(
+            terms, content='', tokenize='unicode61'
+        );
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+        try:
+            self.conn.executescript(self.FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # 不支持FTS5时退回LIKE查询
+            self.fts = False
+
+    def save_daily_report(self, group_name, report_date, report, truncated=False):
+        """保存日报，同一群聊同一天只保留最新一份
+        
+        group_name为聊天记录文件名，作为群聊的标识；日报中的"群聊名称"由模型生成，
+        每次可能不同，只作为标题显示。truncated标记续写后仍被截断的日报。
+        """
+        sections = extract_report_sections(report)
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO daily_reports
+                   (group_name, title, report_date, report, topics, decisions, todos, mentions,
+                    truncated, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (group_name, report_date) DO UPDATE SET
+                   title = excluded.title, report = excluded.report, topics = excluded.topics,
+                   decisions = excluded.decisions, todos = excluded.todos,
+                   mentions = excluded.mentions, truncated = excluded.truncated,
+                   created_at = excluded.created_at""",
+                (
+                    group_name, sections["group"] or group_name, report_date, report,
+                    json.dumps(sections["topics"], ensure_ascii=False),
+                    json.dumps(sections["decisions"], ensure_ascii=False),
+                    json.dumps(sections["todos"], ensure_ascii=False),
+                    json.dumps(sections["mentions"], ensure_ascii=False),
+                    int(truncated), datetime.now().isoformat(timespec="seconds")
+                )
+            )
+
+    def latest_report_date(self):
+        """最近一份日报的日期（聊天记录最后一条消息的日期），没有日报时返回None"""
+        with self.lock:
+            return self.conn.execute("SELECT max(report_date) FROM daily_reports").fetchone()[0]
+
+    def daily_reports(self, start_date, end_date):
+        """按日期范围读取日报的结构化内容"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT group_name, title, report_date, report, topics, decisions, todos, mentions, truncated
+                   FROM daily_reports WHERE report_date BETWEEN ? AND ?
+                   ORDER BY group_name, report_date""",
+                (start_date, end_date)
+            ).fetchall()
+        reports = []
+        for row in rows:
+            report = dict(row)
+            for key in ("topics", "decisions", "todos", "mentions"):
+                report[key] = json.loads(report[key])
+            reports.append(report)
+        return reports
+
+    def save_run(self, kind, group_name, date_start, date_end, report, stats):
+        """保存一次生成的报告及其元数据（模型、token数、耗时）"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                """INSERT INTO runs
+                   (kind, group_name, date_start, date_end, model, endpoint, prompt_tokens,
+                    completion_tokens, ttft, duration, round_trips, report, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    kind, group_name, date_start, date_end,
+                    stats.get("model"), stats.get("endpoint"),
+                    stats.get("prompt_tokens") or None, stats.get("completion_tokens") or None,
+                    stats.get("ttft"), stats.get("duration"), stats.get("round_trips"),
+                    report, datetime.now().isoformat(timespec="seconds")
+                )
+            )
+            if self.fts:
+                self.conn.execute(
+                    "INSERT INTO runs_terms (rowid, terms) VALUES (?, ?)",
+                    (cursor.lastrowid, " ".join(bigram_tokens(report)))
+                )
+            return cursor.lastrowid
+
+    @staticmethod
+    def message_digest(group_name, ts, speaker, content):
+        """消息去重键：对群聊、时间、发言人和内容取摘要，唯一索引中不必保存消息全文"""
+        return hashlib.sha1("\0".join((group_name, str(ts), speaker, content)).encode('utf-8')).digest()
+
+    def save_messages(self, group_name, messages):
+        """保存解析后的聊天消息，重复导入的消息自动去重"""
+        rows = []
+        for m in messages:
+            ts = -1 if m["ts"] is None else m["ts"]
+            rows.append((group_name, ts, m["speaker"], m["content"],
+                         self.message_digest(group_name, ts, m["speaker"], m["content"])))
+        with self.lock, self.conn:
+            last_id = self.conn.execute("SELECT coalesce(max(id), 0) FROM messages").fetchone()[0]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO messages (group_name, ts, speaker, content, digest) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            if self.fts:
+                # 新插入的消息编号都大于插入前的最大编号，只为它们建立索引
+                new_rows = self.conn.execute(
+                    "SELECT id, speaker, content FROM messages WHERE id > ?", (last_id,)
+                ).fetchall()
+                self.conn.executemany(
+                    "INSERT INTO messages_terms (rowid, terms) VALUES (?, ?)",
+                    ((row["id"], " ".join(bigram_tokens(row["speaker"] + " " + row["content"])))
+                     for row in new_rows)
+                )
+
+    def get_run(self, run_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def search(self, query, limit=HISTORY_SEARCH_LIMIT):
+        """全文检索历史报告和聊天消息，空查询时返回最近的报告"""
+        terms = query.split()
+        run_columns = "r.id, r.kind, r.group_name, r.date_start, r.date_end, r.model, r.created_at"
+        with self.lock:
+            if not terms:
+                runs = self.conn.execute(
+                    f"SELECT {run_columns}, substr(r.report, 1, 60) AS snippet FROM runs r "
+                    "ORDER BY r.id DESC LIMIT ?", (limit,)
+                ).fetchall()
+                return [dict(row) for row in runs], []
+            
+            # 每个词转为二元组短语，最后一个词元按前缀匹配；单个汉字无法用二元组匹配，退回LIKE查询。
+            # 消息命中数可能很多，按写入顺序倒序取最新的，避免对全部命中排序
+            phrases = [bigram_tokens(term) for term in terms]
+            if self.fts and all(tokens and not any(len(token) == 1 and token > 'z' for token in tokens)
+                                for tokens in phrases):
+                match = " AND ".join('"' + " ".join(tokens) + '" *' for tokens in phrases)
+                runs = self.conn.execute(
+                    f"""SELECT {run_columns}, r.report AS text
+                        FROM runs_terms JOIN runs r ON r.id = runs_terms.rowid
+                        WHERE runs_terms MATCH ? ORDER BY rank LIMIT ?""",
+                    (match, limit)
+                ).fetchall()
+                messages = self.conn.execute(
+                    """SELECT m.group_name, m.ts, m.speaker, m.content AS text
+                       FROM messages_terms JOIN messages m ON m.id = messages_terms.rowid
+                       WHERE messages_terms MATCH ? ORDER BY messages_terms.rowid DESC LIMIT ?""",
+                    (match, limit)
+                ).fetchall()
+            else:
+                patterns = [f"%{term}%" for term in terms]
+                runs = self.conn.execute(
+                    f"SELECT {run_columns}, r.report AS text FROM runs r WHERE "
+                    + " AND ".join(["r.report LIKE ?"] * len(terms)) + " ORDER BY r.id DESC LIMIT ?",
+                    (*patterns, limit)
+                ).fetchall()
+                messages = self.conn.execute(
+                    "SELECT m.group_name, m.ts, m.speaker, m.content AS text FROM messages m WHERE "
+                    + " AND ".join(["(m.content LIKE ? OR m.speaker LIKE ?)"] * len(terms))
+                    + " ORDER BY m.id DESC LIMIT ?",
+                    (*[p for pattern in patterns for p in (pattern, pattern)], limit)
+                ).fetchall()
+
+        results = []
+        for rows in (runs, messages):
+            items = []
+            for row in rows:
+                item = dict(row)
+                item["snippet"] = highlight_snippet(item.pop("text"), terms)
+                items.append(item)
+            results.append(items)
+        return results[0], results[1]
+
+
+def bigram_tokens(text):
+    """按文本顺序切分词元：英文和数字按单词，中文按字符二元组（单字保留原字）"""
+    tokens = []
+    for run in re.findall(r'[a-z0-9_]+|[\u4e00-\u9fff]+', text.lower()):
+        if run[0] <= 'z' or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def highlight_snippet(text, terms, width=24):
+    """截取首个命中词附近的文本并用【】标出，未命中时返回开头部分"""
+    lowered = text.lower()
+    for term in terms:
+        pos = lowered.find(term.lower())
+        if pos >= 0:
+            start = max(0, pos - width)
+            end = min(len(text), pos + len(term) + width)
+            return (("…" if start > 0 else "") + text[start:pos] + "【" + text[pos:pos + len(term)] + "】"
+                    + text[pos + len(term):end] + ("…" if end < len(text) else ""))
+    return text[:60]
+
+
+def format_message(message):
+    """将消息格式化为一行文本"""
+    if message["ts"] is None:
+        return f"{message['speaker']}: {message['content']}"
+    timestamp = datetime.fromtimestamp(message["ts"]).strftime("%Y-%m-%d %H:%M")
+    return f"{timestamp} {message['speaker']}: {message['content']}"
+
+
+def tokenize(text):
+    """中文友好分词：英文和数字按单词切分，中文使用jieba或字符二元组"""
+    if jieba is None:
+        return bigram_tokens(text)
+    text = text.lower()
+    tokens = re.findall(r'[a-z0-9_]+', text)
+    for run in re.findall(r'[\u4e00-\u9fff]+', text):
+        tokens.extend(word for word in jieba.lcut(run) if word.strip())
+    return tokens
+
+
+def encode_varints(values):
+    """将非负整数序列编码为变长整数字节串（每字节7位）"""
+    if not values or max(values) < 0x80:
+        return bytes(values)
+    data = bytearray()
+    for value in values:
+        while value >= 0x80:
+            data.append(value & 0x7f | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def decode_varints(data):
+    """解码encode_varints生成的字节串"""
+    if not data or max(data) < 0x80:
+        return list(data)
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class ChatIndex:
+    """聊天记录的BM25倒排索引，以重叠的消息窗口为检索单位，支持增量更新
+
+    倒排表按不重叠的消息块（每块WINDOW_STRIDE条消息）记录，检索时把相邻的块
+    合并为窗口计分，得分与直接按窗口建立索引相同，但倒排表只有一半大小。
+    完整的消息块写入二进制文件，打开时内存映射，检索时只解码查询词的倒排表。
+    文件布局：前缀（魔数、头部长度）、JSON头部、块长度表、词组偏移表、
+    按词排序的条目（词、倒排表：块编号差值和词频交替排列的变长整数），
+    每TERM_GROUP个条目记录一次偏移供二分查找。末尾不足一块的消息不写入文件，
+    每次在内存中计算。
+    """
+
+    MAGIC = b"GCRI"
+    PREFIX = struct.Struct("<4sI")
+    TERM_GROUP = 64
+
+    def __init__(self, buffer, file=None):
+        self.buffer = buffer
+        self.file = file
+        magic, header_len = self.PREFIX.unpack_from(buffer, 0)
+        if magic != self.MAGIC:
+            raise ValueError("不是有效的索引文件")
+        self.header = json.loads(bytes(buffer[self.PREFIX.size:self.PREFIX.size + header_len]).decode('utf-8'))
+        if self.header["version"] != INDEX_VERSION or self.header["window"] != [WINDOW_SIZE, WINDOW_STRIDE]:
+            raise ValueError("索引版本不匹配")
+        self.block_count = self.header["block_count"]  # 已写入文件的完整消息块数
+        self.term_count = self.header["term_count"]
+        offset = self.PREFIX.size + header_len
+        group_count = -(-self.term_count // self.TERM_GROUP)
+        self.block_lens = array('I', bytes(buffer[offset:offset + 4 * self.block_count]))
+        offset += 4 * self.block_count
+        self.group_offsets = array('I', bytes(buffer[offset:offset + 4 * group_count]))
+        if sys.byteorder != 'little':
+            self.block_lens.byteswap()
+            self.group_offsets.byteswap()
+        self.entries_start = offset + 4 * group_count
+        self.message_count = self.header["message_count"]
+        self.tail = None           # 末尾不足一块的消息的词频
+        self.doc_count = 0         # 窗口数（含尾部窗口）
+        self.window_norms = []     # 各窗口BM25长度归一化项
+
+    @staticmethod
+    def messages_digest(messages):
+        digest = hashlib.sha1()
+        for message in messages:
+            digest.update(format_message(message).encode('utf-8'))
+        return digest.hexdigest()
+
+    @classmethod
+    def load_or_build(cls, export_path, messages):
+        """加载聊天记录旁的索引；记录只有追加时只为新的消息块建立索引，否则重建"""
+        path = export_path + INDEX_SUFFIX
+        stat = os.stat(export_path)
+        source = [stat.st_size, stat.st_mtime_ns, PARSER_VERSION]
+        tokenizer = "jieba" if jieba is not None else "bigram"
+        base = None
+        if os.path.exists(path):
+            try:
+                base = cls.open(path)
+            except (OSError, ValueError, KeyError, struct.error):
+                base = None
+        if base is not None and (
+                base.header["tokenizer"] != tokenizer
+                or base.header["source"] != source and (
+                    base.message_count > len(messages)
+                    or base.header["digest"] != cls.messages_digest(messages[:base.message_count]))):
+            base.close()
+            base = None
+        
+        if base is not None and base.header["source"] == source:
+            index = base  # 聊天记录未变化，无需校验摘要
+        else:
+            first = base.block_count if base is not None else 0
+            block_lens, postings = cls.build_postings(messages, first, len(messages) // WINDOW_STRIDE)
+            header = {
+                "version": INDEX_VERSION,
+                "window": [WINDOW_SIZE, WINDOW_STRIDE],
+                "tokenizer": tokenizer,
+                "source": source,
+                "message_count": len(messages),
+                "digest": cls.messages_digest(messages),
+                "block_count": first + len(block_lens)
+            }
+            data = cls.serialize(header, block_lens, postings, base)
+            if base is not None:
+                base.close()
+            try:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                index = cls.open(path)
+            except (OSError, ValueError):
+                index = cls(data)  # 目录不可写时只在内存中使用
+        index.add_tail(messages)
+        return index
+
+    @classmethod
+    def open(cls, path):
+        f = open(path, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            f.close()
+            raise
+        try:
+            return cls(buffer, f)
+        except Exception:
+            buffer.close()
+            f.close()
+            raise
+
+    @staticmethod
+    def block_counts(messages, start, end):
+        counts = Counter()
+        for message in messages[start:end]:
+            counts.update(tokenize(format_message(message)))
+        return counts
+
+    @classmethod
+    def build_postings(cls, messages, first, last):
+        """为编号first到last-1的消息块建立倒排表，返回 (块长度列表, 词 -> [块编号, 词频, ...])"""
+        block_lens = []
+        postings = {}
+        for block in range(first, last):
+            counts = cls.block_counts(messages, block * WINDOW_STRIDE, (block + 1) * WINDOW_STRIDE)
+            block_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                entries = postings.get(term)
+                if entries is None:
+                    entries = postings[term] = []
+                entries.append(block)
+                entries.append(tf)
+        return block_lens, postings
+
+    @classmethod
+    def serialize(cls, header, block_lens, postings, base=None):
+        """将索引编码为字节串；已有索引的条目原样复制，新消息块的倒排表追加在后"""
+        entries = bytearray()
+        group_offsets = array('I')
+        count = 0
+        new_terms = sorted(postings)
+        base_entries = base.entries() if base is not None else iter(())
+        base_entry = next(base_entries, None)
+        j = 0
+        while base_entry is not None or j < len(new_terms):
+            term = new_terms[j] if j < len(new_terms) else None
+            if term is None or base_entry is not None and base_entry[0] < term:
+                term, new = base_entry[0], None
+            else:
+                new = postings[term]
+                j += 1
+            previous = 0
+            data = b""
+            if base_entry is not None and term == base_entry[0]:
+                data = bytes(base.buffer[base_entry[1]:base_entry[2]])
+                base_entry = next(base_entries, None)
+                if new:
+                    previous = sum(decode_varints(data)[0::2])  # 已有倒排表的最后一个块编号
+            if new:
+                values = []
+                for k in range(0, len(new), 2):
+                    values.append(new[k] - previous)
+                    values.append(new[k + 1])
+                    previous = new[k]
+                data += encode_varints(values)
+            if count % cls.TERM_GROUP == 0:
+                group_offsets.append(len(entries))
+            term_bytes = term.encode('utf-8')
+            entries += encode_varints([len(term_bytes)]) + term_bytes + encode_varints([len(data)]) + data
+            count += 1
+        
+        header = dict(header, term_count=count)
+        tables = [array('I', base.block_lens if base is not None else []) + array('I', block_lens), group_offsets]
+        if sys.byteorder != 'little':
+            for table in tables:
+                table.byteswap()
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        return b"".join([cls.PREFIX.pack(cls.MAGIC, len(header_bytes)), header_bytes]
+                        + [table.tobytes() for table in tables] + [bytes(entries)])
+
+    def _read_varint(self, pos):
+        value = shift = 0
+        while True:
+            byte = self.buffer[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value, pos
+            shift += 7
+
+    def _read_entry(self, pos):
+        """读取一个条目，返回 (词, 倒排表起点, 倒排表终点)"""
+        length, pos = self._read_varint(pos)
+        term = bytes(self.buffer[pos:pos + length]).decode('utf-8')
+        size, pos = self._read_varint(pos + length)
+        return term, pos, pos + size
+
+    def entries(self):
+        """按词的顺序遍历全部条目"""
+        pos = self.entries_start
+        for _ in range(self.term_count):
+            entry = self._read_entry(pos)
+            yield entry
+            pos = entry[2]
+
+    def find(self, term):
+        """二分查找词所在的词组，再在组内顺序查找，返回倒排表的位置"""
+        lo, hi = 0, len(self.group_offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read_entry(self.entries_start + self.group_offsets[mid])[0] <= term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        pos = self.entries_start + self.group_offsets[lo - 1]
+        for _ in range(min(self.TERM_GROUP, self.term_count - (lo - 1) * self.TERM_GROUP)):
+            entry_term, start, end = self._read_entry(pos)
+            if entry_term == term:
+                return start, end
+            if entry_term > term:
+                return None
+            pos = end
+        return None
+
+    def postings(self, term):
+        """返回词的倒排表 {块编号: 词频}，包含末尾不足一块的消息"""
+        blocks = {}
+        span = self.find(term)
+        if span is not None:
+            values = decode_varints(bytes(self.buffer[span[0]:span[1]]))
+            blocks = dict(zip(accumulate(values[0::2]), values[1::2]))
+        if self.tail and term in self.tail:
+            blocks[self.block_count] = self.tail[term]
+        return blocks
+
+    def add_tail(self, messages):
+        """在内存中统计末尾不足一块的消息，并计算各窗口的长度"""
+        self.message_count = len(messages)
+        start = self.block_count * WINDOW_STRIDE
+        lens = list(self.block_lens)
+        if start < len(messages):
+            self.tail = self.block_counts(messages, start, len(messages))
+            lens.append(sum(self.tail.values()))
+        span = WINDOW_SIZE // WINDOW_STRIDE
+        full = max(0, self.block_count - span + 1)
+        covered = (full - 1) * WINDOW_STRIDE + WINDOW_SIZE if full else 0
+        # 完整窗口之后剩余的消息组成尾部窗口
+        self.doc_count = full + (1 if covered < len(messages) else 0)
+        prefix = [0] + list(accumulate(lens))
+        window_lens = [prefix[min(d + span, len(lens))] - prefix[d] for d in range(self.doc_count)]
+        avg_len = sum(window_lens) / self.doc_count if self.doc_count else 0
+        self.window_norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_len or 1)) for length in window_lens]
+
+    def window_text(self, messages, doc_id):
+        start = doc_id * WINDOW_STRIDE
+        end = min(start + WINDOW_SIZE, self.message_count)
+        return "\n".join(format_message(message) for message in messages[start:end])
+
+    def search(self, query, top_k=FOLLOWUP_TOP_K):
+        """按BM25得分返回最相关的窗口编号"""
+        if not self.doc_count:
+            return []
+        span = WINDOW_SIZE // WINDOW_STRIDE
+        norms = self.window_norms
+        scores = {}
+        for term in set(tokenize(query)):
+            # 窗口d由第d到d+span-1块组成，块的词频累加到包含它的各个窗口
+            blocks = self.postings(term)
+            counts = dict(blocks)
+            get = counts.get
+            for offset in range(1, span):
+                for block, tf in blocks.items():
+                    counts[block - offset] = get(block - offset, 0) + tf
+            for doc_id in chain(range(1 - span, 0), range(self.doc_count, self.block_count + 1)):
+                counts.pop(doc_id, None)  # 不对应任何窗口的编号
+            if not counts:
+                continue
+            weight = math.log(1 + (self.doc_count - len(counts) + 0.5) / (len(counts) + 0.5)) * (BM25_K1 + 1)
+            score = scores.get
+            for doc_id, tf in counts.items():
+                scores[doc_id] = score(doc_id, 0.0) + weight * tf / (tf + norms[doc_id])
+        return heapq.nlargest(top_k, scores, key=scores.get)
+
+    def close(self):
+        if self.file is not None:
+            self.buffer.close()
+            self.file.close()
+            self.file = None
+
+
+def iter_stream_chunks(response):
+    """解析SSE流，逐个产出 (content, finish_reason, usage)"""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if not line.startswith('data: '):
+            continue
+        data_str = line[6:]  # 去掉 'data: ' 前缀
+        if data_str.strip() == '[DONE]':
+            break
+        try:
+            data_json = json.loads(data_str)
+        except json.JSONDecodeError:
+            continue
+        choices = data_json.get('choices') or []
+        usage = data_json.get('usage')
+        if choices:
+            delta = choices[0].get('delta') or {}
+            yield delta.get('content') or "", choices[0].get('finish_reason'), usage
+        elif usage:
+            yield "", None, usage  # 开启include_usage时最后一个分片只含用量
+
+
+class ApiEndpoint:
+    """OpenAI兼容的接口端点，记录健康状态和首字延迟"""
+
+    def __init__(self, name, url, model, api_key=None, prefix_completion=False, include_usage=False):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.prefix_completion = prefix_completion  # 是否支持assistant前缀续写
+        self.include_usage = include_usage          # 是否支持stream_options.include_usage返回token用量
+        self.ewma_ttft = None               # 首字延迟的指数滑动平均（秒）
+        self.ttft_samples = deque(maxlen=50)
+        self.failures = 0
+        self.down_until = 0.0
+
+    def is_healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def record_success(self, ttft):
+        """记录一次成功请求的首字延迟"""
+        self.failures = 0
+        self.down_until = 0.0
+        self.record_sample(ttft)
+
+    def record_cancelled(self, elapsed):
+        """对冲落败被取消时，以已等待时间作为首字延迟的下限样本"""
+        self.record_sample(elapsed)
+
+    def record_sample(self, ttft):
+        self.ttft_samples.append(ttft)
+        if self.ewma_ttft is None:
+            self.ewma_ttft = ttft
+        else:
+            self.ewma_ttft = EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * self.ewma_ttft
+
+    def record_failure(self):
+        """记录一次失败，连续失败时冷却时间翻倍（最长5分钟）"""
+        self.failures += 1
+        cooldown = min(ENDPOINT_COOLDOWN * 2 ** (self.failures - 1), 300)
+        self.down_until = time.monotonic() + cooldown
+
+    def p95_ttft(self):
+        """首字延迟的p95，用作对冲请求的触发时间"""
+        if len(self.ttft_samples) < 5:
+            return DEFAULT_HEDGE_DELAY
+        samples = sorted(self.ttft_samples)
+        return samples[math.ceil(0.95 * len(samples)) - 1]
+
+
+class EndpointPool:
+    """端点列表：按健康状态和延迟排序，供故障切换和对冲请求使用"""
+
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+
+    @classmethod
+    def load(cls, path=ENDPOINTS_FILE):
+        """从配置文件加载端点，跳过缺少url的条目；文件不存在或没有有效端点时使用默认端点"""
+        configs = []
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    configs = json.load(f)
+            except (OSError, ValueError):
+                configs = []
+        if not isinstance(configs, list):
+            configs = []
+        configs = [cfg for cfg in configs if isinstance(cfg, dict) and isinstance(cfg.get("url"), str) and cfg["url"]]
+        endpoints = [
+            ApiEndpoint(
+                str(cfg.get("name") or cfg["url"]),
+                cfg["url"],
+                str(cfg.get("model") or "deepseek-chat"),
+                cfg.get("api_key"),
+                bool(cfg.get("prefix_completion", False)),
+                bool(cfg.get("include_usage", False))
+            )
+            for cfg in configs or DEFAULT_ENDPOINTS
+        ]
+        return cls(endpoints)
+
+    def ranked(self):
+        """健康端点在前，已测速的按首字延迟升序，未测速的按配置顺序排在其后"""
+        return sorted(
+            self.endpoints,
+            key=lambda ep: (not ep.is_healthy(), ep.ewma_ttft is None, ep.ewma_ttft or 0.0)
+        )
+
+
+class StreamJournal:
+    """流式输出日志：每个分片到达即追加写入，用于断线后续写"""
+
+    def __init__(self, job_id):
+        self.path = os.path.join(JOURNAL_DIR, f"{job_id}.txt")
+        self.file = None
+
+    @classmethod
+    def for_messages(cls, messages):
+        """按请求内容生成任务ID，相同的请求对应同一份日志"""
+        raw = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        return cls(hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16])
+
+    @staticmethod
+    def purge_stale(max_age=JOURNAL_MAX_AGE):
+        """清理过期的日志文件"""
+        if not os.path.isdir(JOURNAL_DIR):
+            return
+        now = time.time()
+        for name in os.listdir(JOURNAL_DIR):
+            path = os.path.join(JOURNAL_DIR, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def read(self):
+        """读取上次中断时已输出的内容"""
+        if not os.path.exists(self.path):
+            return ""
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+
+    def append(self, content):
+        if self.file is None:
+            os.makedirs(JOURNAL_DIR, exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(content)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        """任务完成后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamAttempt(threading.Thread):
+    """在单个端点上的一次流式请求，事件通过队列回传给调度方"""
+
+    def __init__(self, endpoint, headers, payload, events):
+        super().__init__(daemon=True)
+        self.endpoint = endpoint
+        self.headers = headers
+        self.payload = payload
+        self.events = events
+        self.cancelled = False
+        self.response = None
+        self.finish_reason = None  # 未输出内容就结束时收到的finish_reason
+        self.started_at = time.monotonic()
+
+    def run(self):
+        try:
+            with requests.post(self.endpoint.url, headers=self.headers, json=self.payload,
+                               timeout=60, stream=True) as response:
+                self.response = response
+                if self.cancelled:
+                    # 等待响应期间已被取消：立即关闭连接，让服务端停止生成
+                    response.close()
+                    return
+                response.raise_for_status()
+                for content, finish_reason, usage in iter_stream_chunks(response):
+                    if self.cancelled:
+                        return
+                    if content or finish_reason:
+                        self.events.put((self, "delta", content, finish_reason))
+                    if usage:
+                        self.events.put((self, "usage", usage, None))
+            if not self.cancelled:
+                self.events.put((self, "done", None, None))
+        except Exception as e:
+            if not self.cancelled:
+                self.events.put((self, "error", e, None))
+
+    def cancel(self):
+        """取消请求并关闭连接"""
+        self.cancelled = True
+        if self.response is not None:
+            try:
+                self.response.close()
+            except Exception:
+                pass
+
+def darken_color(hex_color, factor=0.8):
+    """将颜色变暗用于悬停效果"""
+    hex_color = hex_color.lstrip('#')
+    r, g, b = (int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    return f"#{int(r * factor):02x}{int(g * factor):02x}{int(b * factor):02x}"
+
+
+def lighten_color(hex_color, factor=0.5):
+    """将颜色向白色混合，用于禁用状态"""
+    hex_color = hex_color.lstrip('#')
+    r, g, b = (int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    r, g, b = (int(c + (255 - c) * factor) for c in (r, g, b))
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+@functools.lru_cache(maxsize=None)
+def button_palette(bg_color):
+    """预先计算按钮各状态的颜色"""
+    hover_color = darken_color(bg_color)
+    return {
+        "normal": bg_color,
+        "hover": hover_color,
+        "pressed": darken_color(hover_color),
+        "disabled": lighten_color(bg_color, 0.5),
+        "busy": lighten_color(bg_color, 0.3)
+    }
+
+
+class RoundedButton(tk.Canvas):
+    """Canvas绘制的圆角按钮
+    
+    图形只在创建时绘制一次，悬停、点击和状态切换都通过itemconfig修改颜色和文字，
+    支持 enabled / disabled / busy 三种状态。
+    """
+
+    def __init__(self, parent, text, command, width=120, height=40, bg_color="#4A90E2",
+                 text_color="white", font_size=12, corner_radius=8, busy_text=None):
+        super().__init__(
+            parent,
+            width=width,
+            height=height,
+            highlightthickness=0,
+            bg=parent.cget('bg') if hasattr(parent, 'cget') else 'white'
+        )
+        self.command = command
+        self.text = text
+        self.busy_text = busy_text or text
+        self.palette = button_palette(bg_color)
+        self.state = "enabled"
+        self.hovered = False
+        self.pressed = False
+        self.fill = None
+        
+        # 圆角矩形：两个矩形加四个圆角
+        x1, y1, x2, y2, r = 2, 2, width - 2, height - 2, corner_radius
+        self.shape_ids = [
+            self.create_rectangle(x1 + r, y1, x2 - r, y2, outline=""),
+            self.create_rectangle(x1, y1 + r, x2, y2 - r, outline=""),
+            self.create_arc(x1, y1, x1 + 2*r, y1 + 2*r, start=90, extent=90, outline=""),
+            self.create_arc(x2 - 2*r, y1, x2, y1 + 2*r, start=0, extent=90, outline=""),
+            self.create_arc(x1, y2 - 2*r, x1 + 2*r, y2, start=180, extent=90, outline=""),
+            self.create_arc(x2 - 2*r, y2 - 2*r, x2, y2, start=270, extent=90, outline="")
+        ]
+        self.text_id = self.create_text(
+            width//2, height//2,
+            text=text,
+            fill=text_color,
+            font=("幼圆", font_size, "bold")
+        )
+        self.refresh()
+        
+        # 绑定事件
+        self.bind("<Enter>", self.on_enter)
+        self.bind("<Leave>", self.on_leave)
+        self.bind("<Button-1>", self.on_click)
+
+    def refresh(self):
+        """根据当前状态更新颜色，颜色不变时不触发重绘"""
+        if self.state != "enabled":
+            key = self.state
+        elif self.pressed:
+            key = "pressed"
+        else:
+            key = "hover" if self.hovered else "normal"
+        color = self.palette[key]
+        if color != self.fill:
+            for item in self.shape_ids:
+                self.itemconfig(item, fill=color)
+            self.fill = color
+
+    def configure_button(self, text=None, bg_color=None):
+        """修改按钮文字或底色"""
+        if text is not None:
+            self.text = text
+            if self.state != "busy":
+                self.itemconfig(self.text_id, text=text)
+        if bg_color is not None:
+            self.palette = button_palette(bg_color)
+        self.refresh()
+
+    def set_state(self, state):
+        """切换状态：enabled、disabled 或 busy（后两者不响应点击）"""
+        if state == self.state:
+            return
+        self.state = state
+        self.itemconfig(self.text_id, text=self.busy_text if state == "busy" else self.text)
+        self.update_cursor()
+        self.refresh()
+
+    def update_cursor(self):
+        if not self.hovered:
+            self.config(cursor="")
+        elif self.state == "busy":
+            self.config(cursor="watch")
+        else:
+            self.config(cursor="hand2" if self.state == "enabled" else "")
+
+    def on_enter(self, event):
+        self.hovered = True
+        self.update_cursor()
+        self.refresh()
+
+    def on_leave(self, event):
+        self.hovered = False
+        self.update_cursor()
+        self.refresh()
+
+    def on_click(self, event):
+        if self.state != "enabled" or self.pressed:
+            return
+        # 点击效果：整体下移1像素，延迟恢复
+        self.pressed = True
+        self.move("all", 1, 1)
+        self.refresh()
+        self.after(100, self.release)
+        if self.command:
+            self.command()
+
+    def release(self):
+        self.pressed = False
+        self.move("all", -1, -1)
+        self.refresh()
+
+
+def benchmark_buttons(rounds=2000):
+    """对比按钮事件处理开销：保留图形并itemconfig vs 每次删除重绘"""
+    root = tk.Tk()
+    root.withdraw()
+    button = RoundedButton(root, "生成日报", None, width=375, height=100, bg_color="#A29BFE", font_size=14)
+    legacy = tk.Canvas(root, width=375, height=100, highlightthickness=0)
+    
+    def legacy_redraw(color):
+        # 原实现：每次事件删除全部图形并重新创建
+        legacy.delete("all")
+        x1, y1, x2, y2, r = 2, 2, 373, 98, 8
+        legacy.create_rectangle(x1 + r, y1, x2 - r, y2, fill=color, outline="")
+        legacy.create_rectangle(x1, y1 + r, x2, y2 - r, fill=color, outline="")
+        legacy.create_arc(x1, y1, x1 + 2*r, y1 + 2*r, start=90, extent=90, fill=color, outline="")
+        legacy.create_arc(x2 - 2*r, y1, x2, y1 + 2*r, start=0, extent=90, fill=color, outline="")
+        legacy.create_arc(x1, y2 - 2*r, x1 + 2*r, y2, start=180, extent=90, fill=color, outline="")
+        legacy.create_arc(x2 - 2*r, y2 - 2*r, x2, y2, start=270, extent=90, fill=color, outline="")
+        legacy.create_text(187, 50, text="生成日报", fill="white", font=("幼圆", 14, "bold"))
+    
+    started = time.perf_counter()
+    for _ in range(rounds):
+        legacy_redraw(darken_color("#A29BFE"))
+        legacy_redraw("#A29BFE")
+    legacy_cost = (time.perf_counter() - started) / (rounds * 2) * 1e6
+    
+    started = time.perf_counter()
+    for _ in range(rounds):
+        button.on_enter(None)
+        button.on_leave(None)
+    retained_cost = (time.perf_counter() - started) / (rounds * 2) * 1e6
+    
+    print(f"删除重绘：每次事件 {legacy_cost:.1f} µs，图形ID已增长到 {legacy.find_all()[-1]}")
+    print(f"保留图形：每次事件 {retained_cost:.1f} µs，图形数量保持 {len(button.find_all())}")
+    root.destroy()
+
+
 class ChatAnalyzerApp:
     def __init__(self, root):
         self.root = root
@@ -27,11 +1413,32 @@ class ChatAnalyzerApp:
         self.api_key = tk.StringVar()
         self.username = tk.StringVar()
         self.file_path = tk.StringVar()
+        self.hedge_enabled = tk.BooleanVar(value=False)
+        
+        # 接口端点池
+        self.endpoint_pool = EndpointPool.load()
+        StreamJournal.purge_stale()
+        
+        # 本地日报库
+        self.report_store = ReportStore()
         
         # 流式输出控制
         self.is_streaming = False
         self.stream_buffer = ""
         self.button_state = "generate"  # 按钮状态：generate 或 stop
+        self.stream_label = "日报"       # 当前生成内容的名称：日报、周报或月报
+        self.stream_clear = True         # 本次生成是否清空了结果区域（追问时保留日报）
+        
+        # 历史记录窗口
+        self.history_window = None
+        
+        # 当前聊天记录的快照（文件未变化时复用，按引用计数关闭旧快照）
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
+        
+        # 正在建立检索索引的快照，同一快照只建立一次
+        self.index_builds = set()
+        self.index_ready = threading.Condition()
         
         # 创建主界面
         self.create_widgets()
@@ -193,7 +1600,7 @@ class ChatAnalyzerApp:
         
         # 文件选择
         file_frame = tk.Frame(input_frame, bg="white")
-        file_frame.pack(fill=tk.X, padx=20, pady=(10, 20))
+        file_frame.pack(fill=tk.X, padx=20, pady=10)
         
         tk.Label(
             file_frame,
@@ -215,7 +1622,7 @@ class ChatAnalyzerApp:
         self.file_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         
         # 使用圆角按钮
-        choose_btn = self.create_rounded_button(
+        choose_btn = RoundedButton(
             file_frame,
             "选择文件",
             self.choose_file,
@@ -226,11 +1633,29 @@ class ChatAnalyzerApp:
         )
         choose_btn.pack(side=tk.RIGHT)
         
-        # 生成按钮 - 使用圆角按钮（动态按钮）
-        self.generate_btn = self.create_dynamic_button(
+        # 请求选项
+        option_frame = tk.Frame(input_frame, bg="white")
+        option_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+        
+        tk.Checkbutton(
+            option_frame,
+            text="对冲请求（首字迟迟未到时向备用端点再发一次请求）",
+            variable=self.hedge_enabled,
+            font=("幼圆", 10),
+            bg="white",
+            fg="#666666",
+            activebackground="white",
+            selectcolor="white"
+        ).pack(side=tk.LEFT)
+        
+        # 生成按钮 - 使用圆角按钮（生成日报/停止生成）
+        self.generate_btn = RoundedButton(
             main_container,
+            "生成日报",
+            self.toggle_generation,
             width=375,
             height=100,
+            bg_color="#A29BFE",
             font_size=14
         )
         self.generate_btn.pack(pady=(0, 15))
@@ -253,7 +1678,7 @@ class ChatAnalyzerApp:
         result_label.pack(side=tk.LEFT)
         
         # 清空按钮
-        clear_btn = self.create_rounded_button(
+        clear_btn = RoundedButton(
             result_header,
             "清空",
             self.clear_result,
@@ -264,9 +1689,38 @@ class ChatAnalyzerApp:
         )
         clear_btn.pack(side=tk.RIGHT)
         
+        # 周报/月报汇总按钮（生成过程中禁用，按“生成内容名称”索引）
+        self.action_buttons = {}
+        for period in ("month", "week"):
+            label = ROLLUP_PERIODS[period][1]
+            rollup_btn = RoundedButton(
+                result_header,
+                label,
+                lambda p=period: self.generate_rollup(p),
+                width=120,
+                height=60,
+                bg_color="#74B9FF",
+                font_size=10,
+                busy_text="生成中..."
+            )
+            rollup_btn.pack(side=tk.RIGHT, padx=(0, 10))
+            self.action_buttons[label] = rollup_btn
+        
+        # 历史记录按钮
+        history_btn = RoundedButton(
+            result_header,
+            "历史",
+            self.open_history,
+            width=120,
+            height=60,
+            bg_color="#81ECEC",
+            font_size=10
+        )
+        history_btn.pack(side=tk.RIGHT, padx=(0, 10))
+        
         # 文本显示区域
         text_frame = tk.Frame(result_frame, bg="white")
-        text_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
+        text_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 10))
         
         self.result_text = scrolledtext.ScrolledText(
             text_frame,
@@ -281,6 +1735,34 @@ class ChatAnalyzerApp:
         )
         self.result_text.pack(fill=tk.BOTH, expand=True)
         
+        # 追问区域
+        followup_frame = tk.Frame(result_frame, bg="white")
+        followup_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+        
+        self.followup_entry = tk.Entry(
+            followup_frame,
+            font=("幼圆", 11),
+            relief=tk.FLAT,
+            bg="#f8f8f8",
+            fg="#333333"
+        )
+        self.followup_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        self.add_placeholder(self.followup_entry, FOLLOWUP_PLACEHOLDER)
+        self.followup_entry.bind("<Return>", lambda e: self.ask_followup())
+        
+        ask_btn = RoundedButton(
+            followup_frame,
+            "提问",
+            self.ask_followup,
+            width=120,
+            height=60,
+            bg_color="#A29BFE",
+            font_size=10,
+            busy_text="回答中..."
+        )
+        ask_btn.pack(side=tk.RIGHT)
+        self.action_buttons["回答"] = ask_btn
+        
         # 状态栏
         self.status_label = tk.Label(
             main_container,
@@ -291,201 +1773,6 @@ class ChatAnalyzerApp:
         )
         self.status_label.pack(pady=(10, 0))
     
-    def create_dynamic_button(self, parent, width=375, height=100, font_size=14):
-        """创建动态按钮（生成日报/停止生成）"""
-        # 创建Canvas作为按钮容器
-        canvas = tk.Canvas(
-            parent,
-            width=width,
-            height=height,
-            highlightthickness=0,
-            bg=parent.cget('bg') if hasattr(parent, 'cget') else '#f5f5f5'
-        )
-        
-        # 绘制圆角矩形
-        def draw_rounded_rect(x1, y1, x2, y2, radius, fill_color):
-            canvas.create_rectangle(x1 + radius, y1, x2 - radius, y2, fill=fill_color, outline="")
-            canvas.create_rectangle(x1, y1 + radius, x2, y2 - radius, fill=fill_color, outline="")
-            
-            # 四个圆角
-            canvas.create_arc(x1, y1, x1 + 2*radius, y1 + 2*radius, 
-                            start=90, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x2 - 2*radius, y1, x2, y1 + 2*radius, 
-                            start=0, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x1, y2 - 2*radius, x1 + 2*radius, y2, 
-                            start=180, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x2 - 2*radius, y2 - 2*radius, x2, y2, 
-                            start=270, extent=90, fill=fill_color, outline="")
-        
-        def update_button_appearance():
-            """更新按钮外观"""
-            canvas.delete("all")
-            
-            if self.button_state == "generate":
-                bg_color = "#A29BFE"
-                text = "生成日报"
-                text_color = "white"
-            else:  # stop
-                bg_color = "#E74C3C"
-                text = "停止生成"
-                text_color = "white"
-            
-            draw_rounded_rect(2, 2, width-2, height-2, 8, bg_color)
-            canvas.create_text(
-                width//2, height//2,
-                text=text,
-                fill=text_color,
-                font=("幼圆", font_size, "bold")
-            )
-            
-            return bg_color, text_color
-        
-        # 初始绘制
-        bg_color, text_color = update_button_appearance()
-        
-        # 鼠标事件处理
-        def on_enter(event):
-            canvas.delete("all")
-            if self.button_state == "generate":
-                hover_color = self.darken_color("#A29BFE")
-                text = "生成日报"
-            else:
-                hover_color = self.darken_color("#E74C3C")
-                text = "停止生成"
-                
-            draw_rounded_rect(2, 2, width-2, height-2, 8, hover_color)
-            canvas.create_text(
-                width//2, height//2,
-                text=text,
-                fill="white",
-                font=("幼圆", font_size, "bold")
-            )
-            canvas.config(cursor="hand2")
-        
-        def on_leave(event):
-            update_button_appearance()
-            canvas.config(cursor="")
-        
-        def on_click(event):
-            # 点击效果
-            canvas.delete("all")
-            if self.button_state == "generate":
-                click_color = self.darken_color(self.darken_color("#A29BFE"))
-                text = "生成日报"
-                # 执行生成
-                canvas.after(100, lambda: [on_leave(None), self.generate_report()])
-            else:
-                click_color = self.darken_color(self.darken_color("#E74C3C"))
-                text = "停止生成"
-                # 执行停止
-                canvas.after(100, lambda: [on_leave(None), self.stop_generation()])
-                
-            draw_rounded_rect(3, 3, width-1, height-1, 8, click_color)
-            canvas.create_text(
-                width//2 + 1, height//2 + 1,
-                text=text,
-                fill="white",
-                font=("幼圆", font_size, "bold")
-            )
-        
-        # 绑定事件
-        canvas.bind("<Enter>", on_enter)
-        canvas.bind("<Leave>", on_leave)
-        canvas.bind("<Button-1>", on_click)
-        
-        # 保存更新函数以便外部调用
-        canvas.update_appearance = update_button_appearance
-        
-        return canvas
-    
-    def create_rounded_button(self, parent, text, command, width=120, height=40, 
-                             bg_color="#4A90E2", text_color="white", font_size=12, corner_radius=8):
-        """创建圆角按钮"""
-        # 创建Canvas作为按钮容器
-        canvas = tk.Canvas(
-            parent,
-            width=width,
-            height=height,
-            highlightthickness=0,
-            bg=parent.cget('bg') if hasattr(parent, 'cget') else 'white'
-        )
-        
-        # 绘制圆角矩形
-        def draw_rounded_rect(x1, y1, x2, y2, radius, fill_color):
-            # 绘制圆角矩形的各个部分
-            canvas.create_rectangle(x1 + radius, y1, x2 - radius, y2, fill=fill_color, outline="")
-            canvas.create_rectangle(x1, y1 + radius, x2, y2 - radius, fill=fill_color, outline="")
-            
-            # 四个圆角
-            canvas.create_arc(x1, y1, x1 + 2*radius, y1 + 2*radius, 
-                            start=90, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x2 - 2*radius, y1, x2, y1 + 2*radius, 
-                            start=0, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x1, y2 - 2*radius, x1 + 2*radius, y2, 
-                            start=180, extent=90, fill=fill_color, outline="")
-            canvas.create_arc(x2 - 2*radius, y2 - 2*radius, x2, y2, 
-                            start=270, extent=90, fill=fill_color, outline="")
-        
-        # 初始绘制
-        draw_rounded_rect(2, 2, width-2, height-2, corner_radius, bg_color)
-        
-        # 添加文字
-        text_id = canvas.create_text(
-            width//2, height//2,
-            text=text,
-            fill=text_color,
-            font=("幼圆", font_size, "bold")
-        )
-        
-        # 悬停效果颜色
-        hover_color = self.darken_color(bg_color)
-        
-        # 鼠标事件处理
-        def on_enter(event):
-            canvas.delete("all")
-            draw_rounded_rect(2, 2, width-2, height-2, corner_radius, hover_color)
-            canvas.create_text(
-                width//2, height//2,
-                text=text,
-                fill=text_color,
-                font=("幼圆", font_size, "bold")
-            )
-            canvas.config(cursor="hand2")
-        
-        def on_leave(event):
-            canvas.delete("all")
-            draw_rounded_rect(2, 2, width-2, height-2, corner_radius, bg_color)
-            canvas.create_text(
-                width//2, height//2,
-                text=text,
-                fill=text_color,
-                font=("幼圆", font_size, "bold")
-            )
-            canvas.config(cursor="")
-        
-        def on_click(event):
-            # 点击效果
-            canvas.delete("all")
-            draw_rounded_rect(3, 3, width-1, height-1, corner_radius, self.darken_color(hover_color))
-            canvas.create_text(
-                width//2 + 1, height//2 + 1,
-                text=text,
-                fill=text_color,
-                font=("幼圆", font_size, "bold")
-            )
-            # 延迟恢复
-            canvas.after(100, lambda: on_leave(None))
-            # 执行命令
-            if command:
-                command()
-        
-        # 绑定事件
-        canvas.bind("<Enter>", on_enter)
-        canvas.bind("<Leave>", on_leave)
-        canvas.bind("<Button-1>", on_click)
-        
-        return canvas
-        
     def create_card(self, parent):
         """创建卡片样式的容器"""
         card = tk.Frame(
@@ -555,7 +1842,7 @@ class ChatAnalyzerApp:
         if custom_color:
             btn_bg = custom_color
             btn_fg = "white"
-            btn_active_bg = self.darken_color(custom_color)
+            btn_active_bg = darken_color(custom_color)
         else:
             btn_bg = "#4A90E2" if primary else "#f0f0f0"
             btn_fg = "white" if primary else "#333333"
@@ -589,19 +1876,6 @@ class ChatAnalyzerApp:
         
         return btn
     
-    def darken_color(self, hex_color):
-        """将颜色变暗用于悬停效果"""
-        # 移除#号
-        hex_color = hex_color.lstrip('#')
-        # 转换为RGB
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        # 变暗20%
-        r = int(r * 0.8)
-        g = int(g * 0.8)
-        b = int(b * 0.8)
-        # 转回十六进制
-        return f"#{r:02x}{g:02x}{b:02x}"
-        
     def choose_file(self):
         """选择文件"""
         filename = filedialog.askopenfilename(
@@ -615,6 +1889,126 @@ class ChatAnalyzerApp:
         if filename:
             self.file_path.set(filename)
             self.status_label.config(text=f"已选择文件: {os.path.basename(filename)}")
+    def open_history(self):
+        """打开历史记录/搜索窗口"""
+        if self.history_window is not None and self.history_window.winfo_exists():
+            self.history_window.lift()
+            return
+            
+        window = tk.Toplevel(self.root)
+        window.title("历史记录")
+        window.geometry("800x500")
+        window.configure(bg="#f5f5f5")
+        self.history_window = window
+        
+        search_frame = tk.Frame(window, bg="#f5f5f5")
+        search_frame.pack(fill=tk.X, padx=20, pady=(20, 10))
+        
+        query_var = tk.StringVar()
+        query_entry = tk.Entry(
+            search_frame,
+            textvariable=query_var,
+            font=("幼圆", 11),
+            relief=tk.FLAT,
+            bg="white",
+            fg="#333333"
+        )
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        
+        columns = ("kind", "group", "date", "model", "snippet")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("类型", "群聊", "日期", "模型", "内容"), (60, 120, 150, 110, 340)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, stretch=(column == "snippet"))
+        tree.pack(fill=tk.BOTH, expand=True, padx=20)
+        
+        status = tk.Label(window, text="", font=("Times New Roman", 10), bg="#f5f5f5", fg="#999999")
+        status.pack(pady=(5, 10))
+        
+        message_rows = {}
+        
+        def run_search(event=None):
+            started = time.perf_counter()
+            runs, messages = self.report_store.search(query_var.get().strip())
+            elapsed = (time.perf_counter() - started) * 1000
+            tree.delete(*tree.get_children())
+            message_rows.clear()
+            for run in runs:
+                dates = run["date_start"] or run["created_at"][:10]
+                if run["date_end"] and run["date_end"] != run["date_start"]:
+                    dates += f" ~ {run['date_end']}"
+                snippet = run["snippet"].replace("\n", " ")
+                tree.insert("", tk.END, iid=f"run:{run['id']}",
+                            values=(run["kind"], run["group_name"] or "全部群聊", dates, run["model"] or "", snippet))
+            for i, message in enumerate(messages):
+                timestamp = datetime.fromtimestamp(message["ts"]).strftime("%Y-%m-%d %H:%M") if message["ts"] >= 0 else ""
+                snippet = f"{message['speaker']}: {message['snippet']}".replace("\n", " ")
+                message_rows[f"msg:{i}"] = message
+                tree.insert("", tk.END, iid=f"msg:{i}",
+                            values=("消息", message["group_name"], timestamp, "", snippet))
+            status.config(text=f"找到{len(runs)}份报告、{len(messages)}条消息（用时{elapsed:.0f}ms），双击打开")
+            
+        def open_selected(event=None):
+            selection = tree.selection()
+            if not selection:
+                return
+            iid = selection[0]
+            if iid.startswith("run:"):
+                self.open_history_run(int(iid[4:]))
+            else:
+                message = message_rows[iid]
+                messagebox.showinfo(message["group_name"], f"{message['speaker']}：{message['snippet']}", parent=window)
+                
+        search_btn = RoundedButton(
+            search_frame,
+            "搜索",
+            run_search,
+            width=120,
+            height=60,
+            bg_color="#A29BFE",
+            font_size=10
+        )
+        search_btn.pack(side=tk.RIGHT)
+        
+        query_entry.bind("<Return>", run_search)
+        tree.bind("<Double-1>", open_selected)
+        query_entry.focus_set()
+        run_search()
+        
+    def open_history_run(self, run_id):
+        """从本地数据库重新打开历史报告，不调用API"""
+        if self.is_streaming:
+            messagebox.showinfo("提示", "正在生成中，请稍候...")
+            return
+            
+        run = self.report_store.get_run(run_id)
+        if run is None:
+            return
+            
+        self.result_text.delete(1.0, tk.END)
+        self.stream_buffer = ""
+        self.render_markdown_chunk(run["report"] + "\n")
+        self.status_label.config(text=f"已打开历史{run['kind']}：{run['group_name'] or '全部群聊'} {run['created_at']}（未调用API）")
+        
+    def update_buttons(self):
+        """按生成状态更新按钮：生成按钮切换为停止，其它操作按钮禁用"""
+        if self.button_state == "generate":
+            self.generate_btn.configure_button("生成日报", "#A29BFE")
+        else:
+            self.generate_btn.configure_button("停止生成", "#E74C3C")
+        for label, button in self.action_buttons.items():
+            if self.button_state == "generate":
+                button.set_state("enabled")
+            else:
+                button.set_state("busy" if label == self.stream_label else "disabled")
+        
+    def toggle_generation(self):
+        """生成按钮点击：生成日报或停止生成"""
+        if self.button_state == "generate":
+            self.generate_report()
+        else:
+            self.stop_generation()
+        
     def clear_result(self):
         """清空结果"""
         self.result_text.delete(1.0, tk.END)
@@ -624,7 +2018,7 @@ class ChatAnalyzerApp:
         """停止生成"""
         self.is_streaming = False
         self.button_state = "generate"
-        self.generate_btn.update_appearance()
+        self.update_buttons()
         self.status_label.config(text="已终止生成")
         
     def generate_report(self):
@@ -642,21 +2036,89 @@ class ChatAnalyzerApp:
             messagebox.showinfo("提示", "正在生成中，请稍候...")
             return
             
+        self.start_streaming("日报", self.call_deepseek_api_stream)
+        
+    def generate_rollup(self, period):
+        """根据已保存的日报生成周报或月报"""
+        if self.button_state == "stop":
+            return
+            
+        if self.is_streaming:
+            messagebox.showinfo("提示", "正在生成中，请稍候...")
+            return
+            
+        if self.api_key_missing():
+            messagebox.showwarning("提示", "请输入API Key")
+            return
+            
+        days, label = ROLLUP_PERIODS[period]
+        latest = self.report_store.latest_report_date()
+        if latest is None:
+            messagebox.showinfo("提示", f"还没有已保存的日报，无法生成{label}")
+            return
+            
+        # 日报按聊天记录的日期保存，以最近一份日报的日期为结束日期，汇总较早导出的记录时同样可用
+        end_date = date.fromisoformat(latest)
+        start_date = end_date - timedelta(days=days - 1)
+        reports = self.report_store.daily_reports(start_date.isoformat(), end_date.isoformat())
+            
+        prompt = self.build_rollup_prompt(label, start_date, end_date, reports)
+        on_complete = lambda report, stats: self.report_store.save_run(
+            label, "", start_date.isoformat(), end_date.isoformat(), report, stats)
+        self.start_streaming(label, self.make_stream_api_request, prompt, ROLLUP_MAX_TOKENS, on_complete)
+        
+    def ask_followup(self):
+        """针对当前聊天记录追问，只发送检索到的相关片段"""
+        if self.button_state == "stop":
+            return
+            
+        if self.is_streaming:
+            messagebox.showinfo("提示", "正在生成中，请稍候...")
+            return
+            
+        question = self.followup_entry.get().strip()
+        if not question or question == FOLLOWUP_PLACEHOLDER:
+            messagebox.showwarning("提示", "请输入要追问的问题")
+            return
+            
+        if self.api_key_missing():
+            messagebox.showwarning("提示", "请输入API Key")
+            return
+            
+        if not self.file_path.get():
+            messagebox.showwarning("提示", "请选择聊天记录文件")
+            return
+            
+        self.followup_entry.delete(0, tk.END)
+        self.start_streaming("回答", self.call_followup_stream, self.file_path.get(), question, clear=False)
+        
+    def start_streaming(self, label, target, *args, clear=True):
+        """切换到生成状态并在新线程中执行API调用"""
         # 清空结果区域
-        self.result_text.delete(1.0, tk.END)
+        if clear:
+            self.result_text.delete(1.0, tk.END)
         self.stream_buffer = ""
+        self.stream_label = label
+        self.stream_clear = clear
         
         # 切换按钮状态
         self.button_state = "stop"
-        self.generate_btn.update_appearance()
-        self.status_label.config(text="正在生成日报...")
+        self.update_buttons()
+        self.status_label.config(text=f"正在生成{label}...")
         
         # 在新线程中执行API调用
         self.is_streaming = True
-        thread = threading.Thread(target=self.call_deepseek_api_stream)
+        thread = threading.Thread(target=target, args=args)
         thread.daemon = True
         thread.start()
         
+    def api_key_missing(self):
+        """界面中未填写API Key，且有端点未在endpoints.json中配置自己的api_key"""
+        if all(endpoint.api_key for endpoint in self.endpoint_pool.endpoints):
+            return False
+        api_key = self.api_key.get().strip()
+        return not api_key or api_key == "请输入DeepSeek API Key"
+        
     def validate_inputs(self):
         """验证输入"""
         username = self.username.get().strip()
@@ -664,8 +2126,7 @@ class ChatAnalyzerApp:
             messagebox.showwarning("提示", "请输入用户昵称")
             return False
             
-        api_key = self.api_key.get().strip()
-        if not api_key or api_key == "请输入DeepSeek API Key":
+        if self.api_key_missing():
             messagebox.showwarning("提示", "请输入API Key")
             return False
             
@@ -679,19 +2140,160 @@ class ChatAnalyzerApp:
         """调用DeepSeek API - 流式输出"""
         try:
             # 读取聊天记录
-            with open(self.file_path.get(), 'r', encoding='utf-8') as f:
+            export_path = self.file_path.get()
+            with open(export_path, 'r', encoding='utf-8') as f:
                 chat_history = f.read()
                 
             # 构建提示词
             prompt = self.build_prompt(chat_history)
             
-            # 调用流式API
-            self.make_stream_api_request(prompt)
+            # 解析结果使用快照缓存，文件未变化时无需重新解析
+            snapshot = self.get_snapshot(export_path, chat_history)
+            try:
+                # 按聊天规模确定输出上限
+                max_tokens = estimate_max_tokens(snapshot.stats["count"], snapshot.stats["topics"])
+                
+                # 在后台预先建立检索索引，供追问使用
+                threading.Thread(
+                    target=self.prepare_chat_index,
+                    args=(export_path,),
+                    daemon=True
+                ).start()
+                
+                # 生成完成后保存到本地日报库
+                group_name = os.path.splitext(os.path.basename(export_path))[0]
+                on_complete = lambda report, stats: self.save_daily_run(group_name, snapshot, report, stats)
+                
+                # 调用流式API
+                self.make_stream_api_request(prompt, max_tokens, on_complete)
+            finally:
+                self.release_snapshot(snapshot)
             
         except Exception as e:
             self.is_streaming = False  # 确保停止流式状态
             self.root.after(0, self.display_error, str(e))
             
+    def save_daily_run(self, group_name, snapshot, report, stats):
+        """保存日报、本次生成的元数据和解析后的聊天消息"""
+        if snapshot.stats["first_ts"] is not None:
+            date_start = datetime.fromtimestamp(snapshot.stats["first_ts"]).date().isoformat()
+            date_end = datetime.fromtimestamp(snapshot.stats["last_ts"]).date().isoformat()
+        else:
+            date_start = date_end = date.today().isoformat()
+        self.report_store.save_daily_report(group_name, date_end, report, stats.get("truncated", False))
+        self.report_store.save_run("日报", group_name, date_start, date_end, report, stats)
+        self.report_store.save_messages(group_name, snapshot)
+        
+    def get_snapshot(self, export_path, chat_history=None):
+        """获取聊天记录快照并增加引用计数，用完后需调用release_snapshot
+        
+        文件未变化时复用已打开的快照；文件变化时加载新快照，
+        旧快照在最后一个使用者释放后关闭。
+        """
+        key = ChatSnapshot.source_key(export_path)
+        with self.snapshot_lock:
+            snapshot = self.snapshot
+            if snapshot is None or snapshot.header["source"] != key:
+                self.snapshot = None
+                if snapshot is not None and snapshot.refs == 0:
+                    # 先解除映射，Windows下清理旧快照文件时才能删除
+                    snapshot.close()
+                snapshot = self.snapshot = ChatSnapshot.load_or_build(export_path, chat_history)
+            snapshot.refs += 1
+            return snapshot
+            
+    def release_snapshot(self, snapshot):
+        """释放快照引用，已被新快照替换且无人使用时关闭"""
+        with self.snapshot_lock:
+            snapshot.refs -= 1
+            if snapshot.refs == 0 and snapshot is not self.snapshot:
+                snapshot.close()
+        
+    def get_chat_index(self, export_path, snapshot):
+        """获取快照对应的检索索引，没有时在锁外建立；调用方需持有快照引用"""
+        with self.index_ready:
+            # 其他任务正在建立时等待其完成，不重复建立
+            while snapshot.index is None and snapshot in self.index_builds:
+                self.index_ready.wait()
+            if snapshot.index is not None:
+                return snapshot.index
+            self.index_builds.add(snapshot)
+        
+        index = None
+        try:
+            index = ChatIndex.load_or_build(export_path, snapshot)
+            return index
+        finally:
+            with self.index_ready:
+                snapshot.index = index
+                self.index_builds.discard(snapshot)
+                self.index_ready.notify_all()
+            
+    def prepare_chat_index(self, export_path):
+        """在后台预先建立检索索引"""
+        snapshot = self.get_snapshot(export_path)
+        try:
+            self.get_chat_index(export_path, snapshot)
+        finally:
+            self.release_snapshot(snapshot)
+            
+    def call_followup_stream(self, export_path, question):
+        """检索相关聊天片段并流式回答追问"""
+        try:
+            started = time.perf_counter()
+            snapshot = self.get_snapshot(export_path)
+            try:
+                index = self.get_chat_index(export_path, snapshot)
+                doc_ids = index.search(question)
+                excerpts = "\n\n".join(
+                    f"### 片段{i}\n{index.window_text(snapshot, doc_id)}"
+                    for i, doc_id in enumerate(sorted(doc_ids), 1)
+                )
+            finally:
+                self.release_snapshot(snapshot)
+            elapsed = (time.perf_counter() - started) * 1000
+            
+            self.root.after(0, self.render_markdown_chunk, f"\n## 追问：{question}\n")
+            if not doc_ids:
+                self.root.after(0, self.render_markdown_chunk, "未在聊天记录中检索到相关内容。\n")
+                self.root.after(0, self.stream_complete)
+                return
+                
+            self.root.after(0, lambda: self.status_label.config(
+                text=f"检索到{len(doc_ids)}个相关片段（用时{elapsed:.0f}ms），正在回答..."))
+            prompt = self.build_followup_prompt(question, excerpts)
+            group_name = os.path.splitext(os.path.basename(export_path))[0]
+            on_complete = lambda answer, stats: self.report_store.save_run(
+                "追问", group_name, None, None, f"## 追问：{question}\n{answer}", stats)
+            self.make_stream_api_request(prompt, FOLLOWUP_MAX_TOKENS, on_complete)
+            
+        except Exception as e:
+            self.is_streaming = False  # 确保停止流式状态
+            self.root.after(0, self.display_error, str(e))
+            
+    def build_followup_prompt(self, question, excerpts):
+        """构建追问提示词，只包含检索到的聊天片段"""
+        username = self.username.get().strip()
+        
+        prompt = f"""# 角色
+你是一个群聊日报助手，用户已阅读过群聊日报，现在针对群聊内容提出追问。
+
+## 用户信息
+- 用户昵称：{username}
+
+## 相关聊天片段
+{excerpts}
+
+## 问题
+{question}
+
+## 要求
+- 只根据以上聊天片段回答，引用原话时注明发言人和时间。
+- 如果片段中没有足够信息，请直接说明。
+- 请使用markdown格式输出，回答简洁明了。"""
+        
+        return prompt
+        
     def build_prompt(self, chat_history):
         """构建提示词"""
         username = self.username.get().strip()
@@ -743,90 +2345,298 @@ class ChatAnalyzerApp:
         
         return prompt
         
-    def make_stream_api_request(self, prompt):
-        """发送流式API请求"""
-        url = "https://api.deepseek.com/v1/chat/completions"
+    def build_rollup_prompt(self, label, start_date, end_date, reports):
+        """用已保存日报的结构化内容构建周报/月报提示词，不再发送原始聊天记录"""
+        blocks = []
+        for report in reports:
+            lines = [f"### {report['title']} {report['report_date']}"]
+            if report["truncated"]:
+                lines.append("（该日报因长度限制不完整）")
+            for key, title in (("topics", "话题"), ("decisions", "决策"), ("todos", "待办"), ("mentions", "与我有关")):
+                for item in report[key]:
+                    lines.append(f"- [{title}] {item}")
+            if not any(line.startswith("- [") for line in lines):
+                # 未能提取结构化内容时使用日报原文
+                lines.append(report["report"])
+            blocks.append("\n".join(lines))
+        summaries = "\n\n".join(blocks)
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key.get().strip()}"
-        }
+        prompt = f"""# 角色
+你是一个群聊{label}助手，能够根据多日群聊日报的摘要，汇总出一段时间内的群聊概况。
+
+## 时间范围
+{start_date.isoformat()} 至 {end_date.isoformat()}
+
+## 每日日报摘要
+{summaries}
+
+## 要求
+1. 按群聊分别汇总，概括这段时间内的主要话题及其进展。
+2. 列出已做出的重要决策，以及仍未完成的待办事项（注明负责人）。
+3. 汇总所有与我有关的内容。
+4. 合并不同日期中重复的话题，突出变化和结论。
+
+## 输出格式要求
+- 请使用markdown格式输出
+- 使用适当的标题层级（#、##、###）
+- 重要信息使用**加粗**标记
+- 列表使用-或*标记
+
+请根据以上要求，生成群聊{label}。"""
         
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的群聊日报助手。请使用markdown格式输出结果。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000,
-            "stream": True  # 启用流式输出
-        }
+        return prompt
         
+    def make_stream_api_request(self, prompt, max_tokens=DEFAULT_MAX_TOKENS, on_complete=None):
+        """发送流式API请求，输出被截断时自动续写，完成后回调on_complete(完整输出, 统计信息)"""
+        messages = [
+            {
+                "role": "system",
+                "content": "你是一个专业的群聊日报助手。请使用markdown格式输出结果。"
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        
+        journal = StreamJournal.for_messages(messages)
         try:
-            with requests.post(url, headers=headers, json=data, timeout=60, stream=True) as response:
-                response.raise_for_status()
+            output = journal.read()
+            if output:
+                # 先显示上次中断前的输出，再续写剩余部分
+                self.root.after(0, self.render_markdown_chunk, output)
+                self.root.after(0, lambda: self.status_label.config(text="检测到上次中断的输出，正在续写..."))
+            
+            def on_delta(content):
+                nonlocal output
+                journal.append(content)
+                output += content
+                self.root.after(0, self.render_markdown_chunk, content)
+            
+            stats = {}
+            started = time.monotonic()
+            round_trips = 0
+            resume_attempts = 0
+            continuations = 0
+            finish_reason = None
+            while self.is_streaming:
+                received = len(output)
+                request_messages = self.continuation_messages(messages, output) if output else messages
+                round_trips += 1
+                try:
+                    finish_reason = self.stream_chat_completion(request_messages, on_delta, max_tokens, stats)
+                except Exception:
+                    # 流在输出中途断开时，带上已有输出自动续写
+                    if len(output) == received or resume_attempts >= MAX_RESUME_ATTEMPTS or not self.is_streaming:
+                        raise
+                    resume_attempts += 1
+                    self.root.after(0, lambda: self.status_label.config(text="连接中断，正在续写..."))
+                    continue
                 
-                for line in response.iter_lines():
-                    if not self.is_streaming:  # 检查是否需要停止
-                        break
-                        
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data_str = line[6:]  # 去掉 'data: ' 前缀
-                            
-                            if data_str.strip() == '[DONE]':
-                                break
-                                
-                            try:
-                                data_json = json.loads(data_str)
-                                if 'choices' in data_json and len(data_json['choices']) > 0:
-                                    delta = data_json['choices'][0].get('delta', {})
-                                    if 'content' in delta:
-                                        content = delta['content']
-                                        # 在主线程中更新UI
-                                        self.root.after(0, self.render_markdown_chunk, content)
-                                        
-                            except json.JSONDecodeError:
-                                continue
-                                
+                # 达到max_tokens被截断时自动续写
+                if finish_reason == "length" and continuations < MAX_CONTINUATIONS:
+                    continuations += 1
+                    self.root.after(0, lambda n=continuations: self.status_label.config(
+                        text=f"输出达到长度上限，正在自动续写（第{n}次）..."))
+                    continue
+                break
+            
             # 处理剩余的缓冲区内容
             if self.stream_buffer and self.is_streaming:
                 self.root.after(0, self.render_markdown_chunk, '\n')
-                
-            self.root.after(0, self.stream_complete)
+            
+            # 用户主动停止时同样丢弃日志，下次重新生成而不是续写
+            journal.discard()
+            completed = self.is_streaming
+            truncated = completed and finish_reason == "length"  # 达到续写次数上限后仍被截断
+            self.root.after(0, self.stream_complete, round_trips, truncated)
+            
+            # 界面先恢复可用，再在当前后台线程中保存结果（写入大量消息可能需要数秒）；没有输出时不保存
+            if completed and on_complete is not None and output.strip():
+                stats["duration"] = time.monotonic() - started
+                stats["round_trips"] = round_trips
+                stats["truncated"] = truncated
+                try:
+                    on_complete(output, stats)
+                except Exception as e:
+                    self.root.after(0, messagebox.showwarning, "提示", f"保存到本地日报库失败：{e}")
             
         except Exception as e:
+            # 出错时保留日志以便续写；用户已停止的则丢弃
+            if self.is_streaming:
+                journal.close()
+            else:
+                journal.discard()
             self.is_streaming = False  # 确保停止流式状态
             self.root.after(0, self.display_error, str(e))
     
-    def stream_complete(self):
+    def continuation_messages(self, messages, partial):
+        """构建续写请求：已有输出作为assistant前缀"""
+        return messages + [
+            {
+                "role": "assistant",
+                "content": partial,
+                "prefix": True
+            }
+        ]
+    
+    def build_request(self, endpoint, messages, max_tokens=DEFAULT_MAX_TOKENS):
+        """为指定端点构建请求头和请求体"""
+        api_key = endpoint.api_key or self.api_key.get().strip()
+        if messages and messages[-1].get("prefix") and not endpoint.prefix_completion:
+            # 不支持前缀续写的端点改用续写指令
+            messages = messages[:-1] + [
+                {"role": "assistant", "content": messages[-1]["content"]},
+                {"role": "user", "content": CONTINUE_INSTRUCTION}
+            ]
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        data = {
+            "model": endpoint.model,
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": max_tokens,
+            "stream": True  # 启用流式输出
+        }
+        if endpoint.include_usage:
+            # 部分本地服务不接受未知字段，只对声明支持的端点请求用量
+            data["stream_options"] = {"include_usage": True}
+        return headers, data
+    
+    def stream_chat_completion(self, messages, on_delta, max_tokens=DEFAULT_MAX_TOKENS, stats=None):
+        """在端点池上发起流式请求，每个输出分片回调on_delta，返回finish_reason
+        
+        首字到达前出错会自动切换到下一个端点；开启对冲时，若首个请求在
+        该端点的p95首字延迟内没有输出，则向备用端点再发一次请求，
+        先输出者胜出，另一个请求被取消。端点、首字延迟和token用量累计到stats中。
+        """
+        if stats is None:
+            stats = {}
+        started = time.monotonic()
+        pending = self.endpoint_pool.ranked()
+        events = queue.Queue()
+        attempts = []
+        live = []
+        winner = None
+        finish_reason = None
+        last_error = None
+        
+        def launch():
+            endpoint = pending.pop(0)
+            headers, payload = self.build_request(endpoint, messages, max_tokens)
+            attempt = StreamAttempt(endpoint, headers, payload, events)
+            attempts.append(attempt)
+            live.append(attempt)
+            attempt.start()
+        
+        launch()
+        hedge_at = None
+        if self.hedge_enabled.get() and pending:
+            hedge_at = time.monotonic() + attempts[0].endpoint.p95_ttft()
+        
+        try:
+            while self.is_streaming:  # 检查是否需要停止
+                try:
+                    attempt, kind, value, reason = events.get(timeout=0.1)
+                except queue.Empty:
+                    if winner is None and hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        if pending:
+                            launch()
+                    continue
+                
+                if winner is not None and attempt is not winner:
+                    continue
+                    
+                if kind == "delta":
+                    if winner is None and not value:
+                        # 尚未输出内容，等到首个内容分片再决定胜者
+                        attempt.finish_reason = reason
+                        continue
+                    if winner is None:
+                        winner = attempt
+                        now = time.monotonic()
+                        attempt.endpoint.record_success(now - attempt.started_at)
+                        # 用户实际等待的时间从首个请求发出时算起
+                        stats.setdefault("ttft", now - started)
+                        stats["endpoint"] = attempt.endpoint.name
+                        stats["model"] = attempt.endpoint.model
+                        for other in attempts:
+                            if other is not attempt:
+                                if other in live:
+                                    other.endpoint.record_cancelled(now - other.started_at)
+                                other.cancel()
+                        self.root.after(0, lambda name=attempt.endpoint.name:
+                                        self.status_label.config(text=f"正在生成{self.stream_label}...（{name}）"))
+                    if value:
+                        on_delta(value)
+                    if reason:
+                        finish_reason = reason
+                elif kind == "usage":
+                    stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + (value.get("prompt_tokens") or 0)
+                    stats["completion_tokens"] = stats.get("completion_tokens", 0) + (value.get("completion_tokens") or 0)
+                elif kind == "done" and (attempt is winner or attempt.finish_reason):
+                    if winner is None:
+                        # 正常结束但没有输出内容（如续写时已无剩余部分）
+                        attempt.endpoint.record_success(time.monotonic() - attempt.started_at)
+                        stats["endpoint"] = attempt.endpoint.name
+                        stats["model"] = attempt.endpoint.model
+                        return attempt.finish_reason
+                    return finish_reason
+                else:  # 出错，或响应不是有效的流式输出
+                    if kind == "done":
+                        value = RuntimeError(f"端点 {attempt.endpoint.name} 未返回任何内容")
+                    attempt.endpoint.record_failure()
+                    if attempt is winner:
+                        raise value
+                    live.remove(attempt)
+                    last_error = value
+                    if not live:
+                        if not pending:
+                            raise last_error
+                        launch()
+            return None
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+    
+    def stream_complete(self, round_trips=1, truncated=False):
         """流式输出完成"""
         self.is_streaming = False
         self.button_state = "generate"
-        self.generate_btn.update_appearance()
-        self.status_label.config(text="日报生成完成！")
+        self.update_buttons()
+        if truncated:
+            self.status_label.config(text=f"{self.stream_label}达到长度上限，内容可能不完整")
+        elif round_trips > 1:
+            self.status_label.config(text=f"{self.stream_label}生成完成！（共{round_trips}次请求）")
+        else:
+            self.status_label.config(text=f"{self.stream_label}生成完成！")
         
     def display_error(self, error):
-        """显示错误"""
+        """显示错误；追问出错时把错误追加在回答下方，保留原有日报"""
         self.is_streaming = False
         self.button_state = "generate"
-        self.generate_btn.update_appearance()
-        self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(1.0, f"❌ 错误：{error}", "normal")
+        self.update_buttons()
+        if self.stream_clear:
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(1.0, f"❌ 错误：{error}", "normal")
+        else:
+            if self.stream_buffer:
+                self.render_markdown_chunk("\n")
+            self.result_text.insert(tk.END, f"❌ 错误：{error}\n", "normal")
+            self.result_text.see(tk.END)
         self.status_label.config(text="生成失败")
-        messagebox.showerror("错误", f"生成日报时出错：{error}")
+        messagebox.showerror("错误", f"生成{self.stream_label}时出错：{error}")
 
 
 def main():
     """主函数"""
+    if "--bench-buttons" in sys.argv:
+        benchmark_buttons()
+        return
+        
     root = tk.Tk()
     
     # 设置样式